@@ -0,0 +1,113 @@
+# cython: language_level=3, boundscheck=False, wraparound=False
+"""
+Cython fast path for the ICICI statement line classifier.
+
+classify_lines() accepts the same lines as icici_parser._ROW_RE,
+'DD-MM-YYYY <description> <amount> <balance>', but scans characters directly
+and parses the amounts by hand instead of running the regex engine and
+pd.to_numeric per row.
+"""
+
+import numpy as np
+
+cdef double NAN = float('nan')
+
+cdef inline bint _is_digit(Py_UCS4 c):
+    return c >= u'0' and c <= u'9'
+
+cdef bint _is_date_prefix(str line):
+    """True when line starts with 'DD-MM-YYYY '"""
+    cdef Py_ssize_t i
+    for i in range(10):
+        if i == 2 or i == 5:
+            if line[i] != u'-':
+                return False
+        elif not _is_digit(line[i]):
+            return False
+    return line[10] == u' '
+
+cdef double _parse_amount(str line, Py_ssize_t start, Py_ssize_t end, bint allow_sign):
+    """Parse line[start:end] as [-]digit[digits-and-commas][.digits]; NaN if malformed.
+
+    Digits are accumulated as an exact integer and divided by a power of ten
+    once, which rounds the same way as float() for statement-sized amounts.
+    """
+    cdef Py_ssize_t i = start
+    cdef bint negative = False
+    cdef double mantissa = 0.0
+    cdef double scale = 1.0
+    cdef Py_UCS4 c
+
+    if allow_sign and i < end and line[i] == u'-':
+        negative = True
+        i += 1
+    # Like _ROW_RE, the integer part must start with a digit
+    if i == end or not _is_digit(line[i]):
+        return NAN
+
+    while i < end:
+        c = line[i]
+        if _is_digit(c):
+            mantissa = mantissa * 10.0 + (<int>c - 48)
+        elif c != u',':
+            break
+        i += 1
+
+    if i < end:
+        if line[i] != u'.' or i + 1 == end:
+            return NAN
+        i += 1
+        while i < end:
+            c = line[i]
+            if not _is_digit(c):
+                return NAN
+            mantissa = mantissa * 10.0 + (<int>c - 48)
+            scale *= 10.0
+            i += 1
+
+    mantissa /= scale
+    return -mantissa if negative else mantissa
+
+def classify_lines(list lines):
+    """Split transaction lines into (dates, descriptions, amounts, balances).
+
+    Lines that do not match the row layout are skipped. dates and descriptions
+    are lists of str; amounts and balances are float64 arrays of the same length.
+    """
+    cdef Py_ssize_t n = len(lines)
+    cdef Py_ssize_t i, k = 0, length, amount_start, balance_start
+    cdef double amount, balance
+    cdef str line
+
+    amounts = np.empty(n, dtype=np.float64)
+    balances = np.empty(n, dtype=np.float64)
+    cdef double[::1] amount_view = amounts
+    cdef double[::1] balance_view = balances
+    dates = []
+    descriptions = []
+
+    for i in range(n):
+        line = lines[i]
+        length = len(line)
+        # Shortest possible row: 'DD-MM-YYYY  1 1' (empty description)
+        if length < 15 or not _is_date_prefix(line):
+            continue
+
+        balance_start = line.rfind(u' ') + 1
+        amount_start = line.rfind(u' ', 0, balance_start - 1) + 1
+        # The amount must follow the separator after the description
+        if amount_start - 1 < 11:
+            continue
+
+        amount = _parse_amount(line, amount_start, balance_start - 1, False)
+        balance = _parse_amount(line, balance_start, length, True)
+        if amount != amount or balance != balance:
+            continue
+
+        dates.append(line[:10])
+        descriptions.append(line[11:amount_start - 1])
+        amount_view[k] = amount
+        balance_view[k] = balance
+        k += 1
+
+    return dates, descriptions, amounts[:k], balances[:k]
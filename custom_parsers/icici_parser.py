@@ -1,9 +1,142 @@
-```
 import os
 import re
+import logging
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
 import pdfplumber
+import numpy as np
 import pandas as pd
-from datetime import datetime
+from pdfminer.high_level import extract_pages
+from pdfminer.layout import LAParams, LTTextContainer
+from pdfminer.pdfpage import PDFPage
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional; fall back to the NumPy implementation
+    njit = None
+
+logger = logging.getLogger(__name__)
+
+# Patterns are compiled once at import time rather than looked up per call.
+# Amounts must start with an ASCII digit so every match converts to a number
+# and the Cython classifier accepts exactly the same lines.
+_ROW_RE = re.compile(
+    r'^(\d{2}-\d{2}-\d{4}) (.*) (\d[\d,]*(?:\.\d+)?) (-?\d[\d,]*(?:\.\d+)?)$',
+    re.ASCII
+)
+
+# pdfminer's default layout analysis reads table columns top to bottom. A huge
+# char_margin joins every cell of a row into one text line, and boxes_flow=None
+# orders the lines by vertical position.
+_LAPARAMS = LAParams(char_margin=1000, boxes_flow=None)
+
+def _split_amounts_loop(amounts, balances, debit, credit):
+    """Fill preallocated debit/credit arrays from amounts in a single pass.
+
+    The statement text carries a single amount column, so a transaction is a
+    credit when the balance went up. The first row has no previous balance
+    and is treated as a debit. debit and credit must start out as NaN.
+    """
+    for i in range(amounts.size):
+        if i > 0 and balances[i] > balances[i - 1]:
+            credit[i] = amounts[i]
+        else:
+            debit[i] = amounts[i]
+
+def _split_amounts_numpy(amounts, balances, debit, credit):
+    """NumPy equivalent of _split_amounts_loop for when numba is unavailable."""
+    is_credit = np.zeros(amounts.size, dtype=bool)
+    is_credit[1:] = balances[1:] > balances[:-1]
+    np.copyto(credit, amounts, where=is_credit)
+    np.copyto(debit, amounts, where=~is_credit)
+
+_split_amounts = njit(cache=True)(_split_amounts_loop) if njit else _split_amounts_numpy
+
+def _candidate_lines(page_text: str) -> list:
+    """Return the lines of one page that look like transactions.
+
+    Whitespace inside each line is collapsed to single spaces, and only lines
+    shaped like 'DD-MM-YYYY ...' are kept. This cheap structural check rejects
+    headers and titles before the row classifier runs.
+    """
+    lines = (' '.join(raw.split()) for raw in page_text.splitlines())
+    return [
+        line for line in lines
+        if line[2:3] == '-' and line[5:6] == '-' and line[:2].isdigit()
+    ]
+
+def _load_fast_classifier():
+    """Compile and load the optional Cython line classifier (_icici_fast.pyx).
+
+    Opt-in with ICICI_PARSER_CYTHON=1. pyximport builds the extension into
+    _pyxbld/ on first use and reuses it afterwards. A failed build is logged
+    once and recorded in _pyxbld/, so later imports skip it until the .pyx
+    changes. Returns None when the fast path is off or unavailable, in which
+    case parse() uses the regex/pandas path.
+    """
+    if os.getenv('ICICI_PARSER_CYTHON', '') != '1':
+        return None
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    pyx_path = os.path.join(here, '_icici_fast.pyx')
+    build_dir = os.path.join(here, '_pyxbld')
+    failed_marker = os.path.join(build_dir, '_icici_fast.failed')
+    if os.path.exists(failed_marker) and os.path.getmtime(failed_marker) >= os.path.getmtime(pyx_path):
+        return None
+
+    try:
+        import pyximport
+        # install() sets the build options build_module() reads; the import hooks
+        # it registers are removed straight away since the module is loaded by path
+        importers = pyximport.install(language_level=3)
+        try:
+            so_path = pyximport.build_module('_icici_fast', pyx_path, pyxbuild_dir=build_dir,
+                                             language_level=3)
+        finally:
+            pyximport.uninstall(*importers)
+        spec = importlib.util.spec_from_file_location('_icici_fast', so_path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module.classify_lines
+    except Exception as e:
+        logger.warning(f"Cython classifier unavailable, using the regex path: {e}")
+        try:
+            os.makedirs(build_dir, exist_ok=True)
+            with open(failed_marker, 'w') as f:
+                f.write(f"{e}\n")
+        except OSError:
+            pass
+        return None
+
+_classify_lines = _load_fast_classifier()
+
+def _max_workers() -> int:
+    """Number of page-extraction threads (ICICI_PARSER_MAX_WORKERS, default min(8, cpus))."""
+    default = min(8, os.cpu_count() or 1)
+    try:
+        return max(1, int(os.getenv('ICICI_PARSER_MAX_WORKERS', default)))
+    except ValueError:
+        return default
+
+def _extract_pages(pdf_path: str, page_numbers: list) -> list:
+    """Extract candidate lines from a contiguous run of pages (0-based numbers).
+
+    Text comes from pdfminer directly, skipping the char/word geometry that
+    pdfplumber builds for every page. A page that yields no transaction lines
+    is retried with pdfplumber. Each call opens its own file handle because
+    pdfminer reads from a shared file object and is not safe to use from
+    several threads at once.
+    """
+    candidates = []
+    layouts = extract_pages(pdf_path, page_numbers=page_numbers, laparams=_LAPARAMS)
+    for page_number, layout in zip(page_numbers, layouts):
+        page_text = ''.join(el.get_text() for el in layout if isinstance(el, LTTextContainer))
+        page_lines = _candidate_lines(page_text)
+        if not page_lines:
+            with pdfplumber.open(pdf_path, pages=[page_number + 1]) as pdf:
+                page_lines = _candidate_lines(pdf.pages[0].extract_text() or '')
+        candidates.extend(page_lines)
+    return candidates
 
 def parse(pdf_path: str) -> pd.DataFrame:
     """
@@ -16,54 +149,58 @@ def parse(pdf_path: str) -> pd.DataFrame:
     pd.DataFrame: A pandas DataFrame with the parsed data.
     """
     try:
-        # Open the PDF file
-        with pdfplumber.open(pdf_path) as pdf:
-            # Extract the text from the PDF
-            text = ''
-            for page in pdf.pages:
-                text += page.extract_text()
-        
-        # Clean the text
-        text = re.sub(r'\s+', ' ', text)
-        text = re.sub(r'\n', ' ', text)
-        text = text.strip()
-        
-        # Split the text into lines
-        lines = text.split('\n')
-        
-        # Initialize the data dictionary
-        data = {'Date': [], 'Description': [], 'Debit Amt': [], 'Credit Amt': [], 'Balance': []}
-        
-        # Iterate through the lines
-        for line in lines:
-            # Check if the line contains a date
-            if re.match(r'\d{2}-\d{2}-\d{4}', line):
-                # Extract the date
-                date = datetime.strptime(line, '%d-%m-%Y').date()
-                data['Date'].append(date)
-            # Check if the line contains a description
-            elif re.match(r'.*\d{2,3}.*', line):
-                # Extract the description
-                description = line
-                data['Description'].append(description)
-            # Check if the line contains an amount
-            elif re.match(r'\d{1,3}(,\d{3})*\.?\d{0,2}', line):
-                # Extract the amount
-                amount = float(line.replace(',', ''))
-                if re.match(r'^\d+\.?\d{0,2}$', line):
-                    data['Debit Amt'].append(amount)
-                elif re.match(r'^\d{1,3}(,\d{3})*\.?\d{0,2}$', line):
-                    data['Credit Amt'].append(amount)
-        
-        # Convert the data dictionary to a pandas DataFrame
-        df = pd.DataFrame(data)
-        
-        # Calculate the balance
-        df['Balance'] = df['Credit Amt'].cumsum()
-        
+        # Open the PDF file once to count pages
+        with open(pdf_path, 'rb') as fp:
+            page_count = sum(1 for _ in PDFPage.get_pages(fp))
+
+        # Split the pages into one contiguous run per worker. executor.map returns
+        # results in submission order, so the output matches a single-threaded run.
+        workers = max(1, min(_max_workers(), page_count))
+        chunk = max(1, -(-page_count // workers))
+        runs = [list(range(start, min(start + chunk, page_count)))
+                for start in range(0, page_count, chunk)]
+
+        candidates = []
+        if len(runs) > 1:
+            with ThreadPoolExecutor(max_workers=len(runs)) as executor:
+                for run_lines in executor.map(lambda run: _extract_pages(pdf_path, run), runs):
+                    candidates.extend(run_lines)
+        elif runs:
+            candidates = _extract_pages(pdf_path, runs[0])
+
+        # Split each candidate line into date, description, amount and balance;
+        # lines that do not match the row layout are dropped
+        if _classify_lines is not None:
+            date_text, descriptions, amounts, balances = _classify_lines(candidates)
+            date_text = pd.Series(date_text, dtype=str)
+            descriptions = pd.Series(descriptions, dtype=str).array
+        else:
+            rows = pd.Series(candidates, dtype=str).str.extract(_ROW_RE).dropna()
+            date_text = rows[0]
+            descriptions = rows[1].array
+            amounts = pd.to_numeric(rows[2].str.replace(',', '', regex=False)).to_numpy(np.float64)
+            balances = pd.to_numeric(rows[3].str.replace(',', '', regex=False)).to_numpy(np.float64)
+
+        # One typed array per output column (structure of arrays). The debit and
+        # credit columns are allocated once and filled in place by the kernel.
+        n = len(amounts)
+        dates = pd.to_datetime(date_text, format='%d-%m-%Y').array
+        debit = np.full(n, np.nan)
+        credit = np.full(n, np.nan)
+        _split_amounts(amounts, balances, debit, credit)
+
+        # Build the DataFrame straight from the column arrays; they carry no index,
+        # so there is no alignment step or reset_index copy
+        df = pd.DataFrame({
+            'Date': dates,
+            'Description': descriptions,
+            'Debit Amt': debit,
+            'Credit Amt': credit,
+            'Balance': balances,
+        })
+
         return df
-    
+
     except Exception as e:
         print(f"Error: {e}")
         return None
-```
\ No newline at end of file
@@ -79,5 +79,370 @@ def test_csv_format_match():
     else:
         pytest.skip("Required files not found")
 
+def test_icici_parser_values_match_csv():
+    """Test that parsed transactions match the expected CSV row for row"""
+    pdf_path = "data/icici/icici_sample.pdf"
+    csv_path = "data/icici/result.csv"
+    if not (os.path.exists(pdf_path) and os.path.exists(csv_path)):
+        pytest.skip("Required files not found")
+    
+    sys.path.insert(0, "custom_parsers")
+    import icici_parser
+    
+    result_df = icici_parser.parse(pdf_path)
+    expected_df = pd.read_csv(csv_path)
+    expected_df['Date'] = pd.to_datetime(expected_df['Date'], format='%d-%m-%Y')
+    
+    pd.testing.assert_frame_equal(result_df, expected_df)
+
+def test_icici_fast_classifier_matches_regex(monkeypatch):
+    """Test that the Cython line classifier agrees with the regex path"""
+    import numpy as np
+    sys.path.insert(0, "custom_parsers")
+    import icici_parser
+    
+    monkeypatch.setenv("ICICI_PARSER_CYTHON", "1")
+    classify_lines = icici_parser._load_fast_classifier()
+    if classify_lines is None:
+        pytest.skip("Cython fast path not available")
+    
+    lines = [
+        "01-08-2024 Salary Credit XYZ Pvt Ltd 1,935.3 6864.58",
+        "02-08-2024 Refund 12 -566.45",
+        "03-08-2024  1 2",
+        "04-08-2024 Bad amount 1. 2",
+        "05-08-2024 Trailing text 1.00 2.00 x",
+        "06-08-2024 X , 5",
+        "07-08-2024 X 5 ,",
+        "08-08-2024 X ,5 6",
+        "09-08-2024 X 5 -,6",
+        "10-08-2024 Unicode digits \u0661\u0662 5",
+        "\u0661\u0661-08-2024 Unicode date 1 2",
+        "12-08-2024 Trailing comma 1, 2,",
+        "Date Description Debit Amt Credit Amt Balance",
+    ]
+    dates, descriptions, amounts, balances = classify_lines(lines)
+    rows = pd.Series(lines, dtype=str).str.extract(icici_parser._ROW_RE).dropna()
+    
+    assert dates == list(rows[0])
+    assert descriptions == list(rows[1])
+    assert np.array_equal(amounts, pd.to_numeric(rows[2].str.replace(",", "")).to_numpy())
+    assert np.array_equal(balances, pd.to_numeric(rows[3].str.replace(",", "")).to_numpy())
+
+def test_llm_cache_hit_skips_api(tmp_path, monkeypatch):
+    """Test that a repeated prompt is served from the on-disk cache"""
+    from types import SimpleNamespace
+    from agent import BankParserAgent
+    
+    monkeypatch.chdir(tmp_path)
+    calls = []
+    
+    def create(**kwargs):
+        calls.append(kwargs)
+        message = SimpleNamespace(content="cached reply")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+    
+    agent = BankParserAgent.__new__(BankParserAgent)
+    agent.model = "test-model"
+    agent.use_cache = True
+    agent.cache_ttl = 60
+    agent.llm = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    
+    assert agent._cached_completion("hello") == "cached reply"
+    assert agent._cached_completion("hello") == "cached reply"
+    assert len(calls) == 1, "Second call should be a cache hit"
+    
+    agent.use_cache = False
+    agent._cached_completion("hello")
+    assert len(calls) == 2, "Cache should be bypassed when disabled"
+
+def _stub_agent(create):
+    """BankParserAgent with the Groq client replaced by a stubbed create()"""
+    from types import SimpleNamespace
+    from agent import BankParserAgent
+    
+    agent = BankParserAgent.__new__(BankParserAgent)
+    agent.model = "test-model"
+    agent.use_cache = True
+    agent.cache_ttl = 60
+    agent.speculative = False
+    agent._semantic_cache_disabled = True
+    agent.llm = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    agent.llm.options = []
+    
+    def with_options(**options):
+        agent.llm.options.append(options)
+        return agent.llm
+    
+    agent.llm.with_options = with_options
+    return agent
+
+def _reply(content):
+    """Chat completion response shaped like the Groq client's"""
+    from types import SimpleNamespace
+    message = SimpleNamespace(content=content)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+def _stub_state(tmp_path):
+    """AgentState for a fake 'demo' bank with a small expected CSV"""
+    from agent import AgentState
+    
+    return AgentState(
+        target_bank="demo",
+        pdf_path=str(tmp_path / "demo.pdf"),
+        csv_path=str(tmp_path / "result.csv"),
+        parser_path=str(tmp_path / "demo_parser.py"),
+        errors=[],
+        current_plan=["Parse the PDF"],
+        csv_head=pd.DataFrame({"Date": ["01-08-2024"], "Balance": [10.0]}),
+        expected_df=pd.DataFrame({"Date": ["01-08-2024"], "Balance": [10.0]}),
+    )
+
+def test_failed_generation_not_cached(tmp_path, monkeypatch):
+    """Test that a generated parser which fails its tests is not replayed from the cache"""
+    import json
+    
+    monkeypatch.chdir(tmp_path)
+    calls = []
+    
+    def create(**kwargs):
+        calls.append(kwargs)
+        return _reply(json.dumps({"code": f"# attempt {len(calls)}"}))
+    
+    agent = _stub_agent(create)
+    agent._test_phase = lambda state: {"success": False, "error": "boom"}
+    state = _stub_state(tmp_path)
+    
+    state.generated_code = agent._generate_phase(state)
+    assert not agent._accept_candidate(state)
+    assert not state.completion_cache_path.exists()
+    assert agent._generate_phase(_stub_state(tmp_path)) == "# attempt 2\n"
+    assert len(calls) == 2, "Failing generation should not be served from the cache"
+    
+    agent._test_phase = lambda state: {"success": True, "message": "ok"}
+    state.generated_code = agent._generate_phase(state)
+    assert agent._accept_candidate(state)
+    assert state.completion_cache_path.exists(), "Passing generation should stay cached"
+
+def test_speculative_accepts_first_passing_candidate(tmp_path, monkeypatch):
+    """Test that speculative mode keeps the first passing parser and records failures"""
+    import json
+    import threading
+    import time
+    from agent import SPECULATIVE_REQUEST_TIMEOUT
+    
+    monkeypatch.chdir(tmp_path)
+    release = threading.Event()
+    
+    def create(**kwargs):
+        if kwargs["temperature"] == 0.0:
+            code = "# bad"
+        elif kwargs["temperature"] == 0.2:
+            time.sleep(0.2)
+            code = "# good"
+        else:
+            release.wait(5)
+            code = "# late"
+        return _reply(json.dumps({"code": code}))
+    
+    def test_phase(state):
+        if "good" not in state.generated_code:
+            return {"success": False, "error": "bad parser"}
+        # Let the last reply reach the cache while the winner is still being tested
+        release.set()
+        deadline = time.time() + 5
+        while len(list(tmp_path.glob(".cache/llm/*.json"))) < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        return {"success": True, "message": "ok"}
+    
+    agent = _stub_agent(create)
+    agent.speculative = True
+    agent._test_phase = test_phase
+    state = _stub_state(tmp_path)
+    
+    try:
+        assert agent._run_speculative(state)
+    finally:
+        release.set()
+        for thread in threading.enumerate():
+            if thread.name.startswith("ThreadPoolExecutor"):
+                thread.join(5)
+    
+    assert Path(state.parser_path).read_text() == "# good\n"
+    assert state.errors == ["bad parser"]
+    assert agent.llm.options == [{"max_retries": 0, "timeout": SPECULATIVE_REQUEST_TIMEOUT}] * 3
+    # The failing reply and the untested late one are evicted
+    cached = [json.loads(p.read_text())["content"] for p in tmp_path.glob(".cache/llm/*.json")]
+    assert cached == [json.dumps({"code": "# good"})]
+
+_EXPECTED_ROWS = {
+    "Date": ["01-08-2024", "02-08-2024"],
+    "Description": ["Salary", "Rent"],
+    "Debit Amt": [None, 500.0],
+    "Credit Amt": [1000.0, None],
+    "Balance": [1000.0, 500.0],
+}
+
+@pytest.mark.parametrize("overrides, error", [
+    ({}, None),
+    ({"Date": ["2024-08-01", "2024-08-02"]}, "only 0% of Date values are valid dates"),
+    ({"Balance": [None, None]}, "no numeric values in ['Balance']"),
+])
+def test_test_phase_validation(tmp_path, overrides, error):
+    """Test that _test_phase checks date formats and required numeric columns"""
+    agent = _stub_agent(create=None)
+    state = _stub_state(tmp_path)
+    state.expected_df = pd.DataFrame(_EXPECTED_ROWS)
+    rows = {**_EXPECTED_ROWS, **overrides}
+    Path(state.parser_path).write_text(
+        f"import pandas as pd\n\ndef parse(pdf_path):\n    return pd.DataFrame({rows!r})\n"
+    )
+    
+    result = agent._test_phase(state)
+    
+    if error is None:
+        assert result["success"], result
+        assert result["message"] == "Parser working correctly. Generated 2 transactions."
+    else:
+        assert not result["success"]
+        assert result["error"] == f"Data validation failed: {error}"
+
+def _run_demo_bank(tmp_path, monkeypatch, replies, csv_text=None):
+    """Run the sequential agent loop on a fake 'demo' bank whose parsers always fail.
+    
+    Returns the prompts sent to the stubbed create(), in order.
+    """
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "data" / "demo").mkdir(parents=True)
+    (tmp_path / "data" / "demo" / "demo_sample.pdf").write_bytes(b"")
+    if csv_text is None:
+        csv_text = pd.DataFrame({"Date": ["01-08-2024"], "Balance": [10.0]}).to_csv(index=False)
+    (tmp_path / "data" / "demo" / "result.csv").write_text(csv_text)
+    prompts = []
+    
+    def create(**kwargs):
+        prompts.append(kwargs["messages"][0]["content"])
+        return _reply(replies[len(prompts) - 1])
+    
+    agent = _stub_agent(create)
+    agent._plan_phase = lambda state: ["Parse the PDF"]
+    agent._test_phase = lambda state: {"success": False, "error": f"failed {state.generated_code.strip()}"}
+    assert not agent.run("demo")
+    return prompts
+
+def test_retry_prompt_pairs_code_with_its_error(tmp_path, monkeypatch):
+    """Test that retries send the last tested code with that code's own error"""
+    import json
+    
+    prompts = _run_demo_bank(tmp_path, monkeypatch, [
+        json.dumps({"code": "# v1"}),
+        "not json",
+        json.dumps({"code": "# v3"}),
+    ])
+    
+    assert len(prompts) == 3
+    assert "Implementation Plan" in prompts[0]
+    # Attempt 2 failed to decode, so attempt 3 still fixes v1 and its test error
+    for prompt in prompts[1:]:
+        assert "Implementation Plan" not in prompt
+        assert "# v1" in prompt and "failed # v1" in prompt
+        assert "Expecting value" not in prompt
+
+def test_malformed_csv_stops_run(tmp_path, monkeypatch):
+    """Test that a CSV malformed past the peeked head stops the run before testing"""
+    import json
+    from agent import CSV_PEEK_ROWS
+    
+    csv_text = "Date,Balance\n" + "01-08-2024,10.0\n" * (CSV_PEEK_ROWS + 50) + "01-08-2024,10.0,extra\n"
+    prompts = _run_demo_bank(tmp_path, monkeypatch, [json.dumps({"code": "# v1"})], csv_text=csv_text)
+    
+    assert len(prompts) == 1, "A bad expected CSV should not be blamed on the parser"
+
+def test_failed_template_falls_back_to_full_prompt(tmp_path, monkeypatch):
+    """Test that the attempt after a failing template gets the plan and schema"""
+    import json
+    pytest.importorskip("jinja2")
+    from agent import TEMPLATES_DIR, schema_hash
+    
+    template_dir = tmp_path / TEMPLATES_DIR
+    template_dir.mkdir()
+    head = pd.DataFrame({"Date": ["01-08-2024"], "Balance": [10.0]})
+    (template_dir / f"{schema_hash(head)}.py.j2").write_text("# template for {{ bank }}")
+    
+    prompts = _run_demo_bank(tmp_path, monkeypatch, [
+        json.dumps({"code": "# v2"}),
+        json.dumps({"code": "# v3"}),
+    ])
+    
+    assert len(prompts) == 2
+    assert "Implementation Plan" in prompts[0] and "failed # template for demo" in prompts[0]
+    assert "# v2" in prompts[1] and "failed # v2" in prompts[1]
+
+def test_parser_template_round_trip():
+    """Test that a saved parser template renders back to the original code"""
+    jinja2 = pytest.importorskip("jinja2")
+    from agent import code_to_template
+    
+    code = 'BANK = "ICICI"\nPATTERNS = {"icici": r"\\d{2}"}\n# {{ not a tag }}\n'
+    template = jinja2.Template(code_to_template(code, "icici"))
+    
+    assert template.render(bank="icici") == code
+    assert template.render(bank="sbi") == code.replace("ICICI", "SBI").replace("icici", "sbi")
+
+def test_unusable_plan_not_cached(tmp_path, monkeypatch):
+    """Test that a plan reply without a list of steps is not replayed from the cache"""
+    import json
+    
+    monkeypatch.chdir(tmp_path)
+    calls = []
+    
+    def create(**kwargs):
+        calls.append(kwargs)
+        return _reply(json.dumps({"plan": ["Parse the PDF"]}))
+    
+    agent = _stub_agent(create)
+    state = _stub_state(tmp_path)
+    
+    fallback = agent._plan_phase(state)
+    assert agent._plan_phase(state) == fallback
+    assert len(calls) == 2, "Unusable plan should have been evicted from the cache"
+    assert not list(tmp_path.glob(".cache/llm/*.json"))
+
+def test_failed_template_is_replaced(tmp_path, monkeypatch):
+    """Test that an accepted LLM parser overwrites a template that failed this run"""
+    pytest.importorskip("jinja2")
+    
+    monkeypatch.chdir(tmp_path)
+    agent = _stub_agent(create=None)
+    state = _stub_state(tmp_path)
+    template_path = agent._template_path(state)
+    template_path.parent.mkdir()
+    template_path.write_text("stale")
+    
+    state.generated_code = "# fixed\n"
+    agent._save_template(state)
+    assert template_path.read_text() == "stale", "A working template should be kept"
+    
+    state.template_failed = True
+    agent._save_template(state)
+    assert template_path.read_text() != "stale"
+
+def test_csv_schema_digest():
+    """Test that the prompt schema digest captures column formats"""
+    import json
+    from agent import csv_schema
+    
+    df = pd.DataFrame({
+        "Date": ["01-08-2024", "02-08-2024"],
+        "Debit Amt": [None, 12.5],
+        "Count": [1, 2],
+    })
+    schema = {c["col"]: c for c in json.loads(csv_schema(df))}
+    
+    assert schema["Date"]["pattern"] == "DD-MM-YYYY"
+    assert schema["Debit Amt"]["pattern"] == "<=1dp, may be blank"
+    assert schema["Debit Amt"]["example"] == "12.5"
+    assert schema["Count"]["pattern"] == "integer"
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])